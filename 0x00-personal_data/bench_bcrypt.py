@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""A benchmark of batch password hashing against pool size and rounds.
+"""
+import os
+import time
+import argparse
+from typing import List
+
+from encrypt_password import hash_passwords
+
+
+def bench(count: int, rounds: int, workers: int) -> float:
+    """Measures the hashes per second of one batch.
+    """
+    passwords = ['password{}'.format(i) for i in range(count)]
+    start = time.perf_counter()
+    hash_passwords(passwords, rounds=rounds, workers=workers)
+    return count / (time.perf_counter() - start)
+
+
+def parse_ints(text: str) -> List[int]:
+    """Parses a comma-separated list of integers.
+    """
+    return [int(x) for x in text.split(',')]
+
+
+def main():
+    """Prints hashes per second for each rounds and pool size.
+    """
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--count', type=int, default=32,
+                        help="passwords per batch (default: %(default)s)")
+    parser.add_argument('-r', '--rounds', type=parse_ints, default=[10, 12],
+                        help="comma-separated work factors")
+    parser.add_argument('-w', '--workers', type=parse_ints,
+                        default=sorted({1, 2, 4, cpus}),
+                        help="comma-separated pool sizes")
+    args = parser.parse_args()
+    print("{:>6} {:>7} {:>10}".format("rounds", "workers", "hashes/s"))
+    for rounds in args.rounds:
+        for workers in args.workers:
+            rate = bench(args.count, rounds, workers)
+            print("{:>6} {:>7} {:>10.1f}".format(rounds, workers, rate))
+
+
+if __name__ == "__main__":
+    main()
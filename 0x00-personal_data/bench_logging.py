@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""A micro-benchmark suite for redaction and user data log formatting.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tracemalloc
+from itertools import product
+from typing import Callable, Dict, List
+
+from filtered_logger import (
+    PII_FIELDS, RedactingFormatter, RowRedactor, filter_datum)
+
+
+OTHER_FIELDS = ("ip", "last_login", "user_agent")
+SEPARATORS = (";", "|", ", ")
+
+
+def make_row(value_length: int, pii_count: int, present: float) -> dict:
+    """Builds a synthetic user row.
+
+    ``pii_count`` sensitive fields are redacted, of which only the
+    ``present`` share appears in the row next to the non-sensitive ones.
+    """
+    shown = round(pii_count * present)
+    columns = PII_FIELDS[:shown] + OTHER_FIELDS
+    return {
+        column: (column * value_length)[:value_length] for column in columns
+    }
+
+
+def make_message(row: dict, separator: str) -> str:
+    """Renders a row as a 'k=v;' log line.
+    """
+    pairs = ['{}={}'.format(k, v) for k, v in row.items()]
+    return '{}{}'.format(separator.join(pairs), separator)
+
+
+def measure(op: Callable[[], object], min_time: float) -> Dict[str, float]:
+    """Measures the time and memory allocated per call of an operation.
+    """
+    op()
+    loops, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            op()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9:
+            break
+        loops *= 2
+    samples = min(loops, 100)
+    tracemalloc.start()
+    allocated = 0
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        op()
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return {
+        "ns_per_op": elapsed / loops,
+        "alloc_bytes_per_op": allocated / samples,
+        "loops": loops,
+    }
+
+
+def benchmarks(
+    row: dict, pii_count: int, separator: str,
+        ) -> Dict[str, Callable]:
+    """Builds the benchmarked operations for one set of parameters.
+    """
+    fields = list(PII_FIELDS[:pii_count])
+    message = make_message(row, separator)
+    columns, values = (list(row), tuple(row.values()))
+    row_redactor = RowRedactor(columns, fields, separator=separator)
+    template = '{};'.format('; '.join(map('{}={{}}'.format, columns)))
+    ops = {
+        "filter_datum":
+            lambda: filter_datum(fields, "***", message, separator),
+        "row_redactor": lambda: row_redactor.format_row(values),
+    }
+    if separator == RedactingFormatter.SEPARATOR:
+        formatter = RedactingFormatter(fields)
+        args = ("user_data", logging.INFO, None, None, message, None, None)
+        record = logging.LogRecord(*args)
+        args = ("user_data", logging.INFO, None, None, row, None, None)
+        dict_record = logging.LogRecord(*args)
+        ops["formatter_string"] = lambda: formatter.format(record)
+        ops["formatter_dict"] = lambda: formatter.format(dict_record)
+        ops["main_row_legacy"] = lambda: formatter.format(logging.LogRecord(
+            "user_data", logging.INFO, None, None,
+            template.format(*values), None, None))
+    return ops
+
+
+def run(args: argparse.Namespace) -> List[dict]:
+    """Runs every benchmark over the parameter grid.
+    """
+    results = []
+    grid = product(args.value_lengths, args.pii_counts, args.present,
+                   args.separators)
+    for value_length, pii_count, present, separator in grid:
+        row = make_row(value_length, pii_count, present)
+        params = {
+            "value_length": value_length,
+            "pii_fields": pii_count,
+            "present": present,
+            "separator": separator,
+            "message_length": len(make_message(row, separator)),
+        }
+        for name, op in benchmarks(row, pii_count, separator).items():
+            result = {"benchmark": name, "params": params}
+            result.update(measure(op, args.min_time))
+            results.append(result)
+            print("{:<18} {} {:>10.0f} ns/op {:>8.0f} B/op".format(
+                name, json.dumps(params), result["ns_per_op"],
+                result["alloc_bytes_per_op"]), file=sys.stderr)
+    return results
+
+
+def parse_list(cast: Callable) -> Callable[[str], list]:
+    """Builds a parser for comma-separated option values.
+    """
+    return lambda text: [cast(x) for x in text.split(',')]
+
+
+def main():
+    """Runs the suite and writes the results as JSON.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-o', '--output', help="JSON file (default: stdout)")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="seconds per measurement (default: %(default)s)")
+    parser.add_argument('--value-lengths', type=parse_list(int),
+                        default=[8, 64, 512])
+    parser.add_argument('--pii-counts', type=parse_list(int),
+                        default=[1, 3, len(PII_FIELDS)])
+    parser.add_argument('--present', type=parse_list(float),
+                        default=[0.0, 0.5, 1.0])
+    parser.add_argument('--separators', nargs='+', default=list(SEPARATORS))
+    args = parser.parse_args()
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": run(args),
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
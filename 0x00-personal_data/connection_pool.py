@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""A module for pooling and reusing database connections.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection can be checked out in time.
+    """
+
+
+def is_alive(connection: Any) -> bool:
+    """Checks that a DB-API connection can still run a query.
+    """
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception:
+        return False
+    return True
+
+
+class ConnectionPool:
+    """A bounded pool of connections created on demand.
+    """
+
+    def __init__(
+        self, connect: Callable[[], Any], size: int = 5,
+        timeout: float = 30.0, ping: bool = True,
+        check: Callable[[Any], bool] = is_alive,
+            ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping = ping
+        self.check = check
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self) -> Any:
+        """Checks out a connection, waiting up to the pool timeout.
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(
+                "No connection available after {}s".format(self.timeout))
+        try:
+            while True:
+                try:
+                    connection = self.idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                if not self.ping or self.check(connection):
+                    return connection
+                self.discard(connection)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection: Any):
+        """Returns a checked out connection to the pool.
+        """
+        self.idle.put(connection)
+        self.slots.release()
+
+    @staticmethod
+    def discard(connection: Any):
+        """Closes a connection that is leaving the pool.
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Lends a connection for the duration of a with block.
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        """Closes every idle connection in the pool.
+        """
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except queue.Empty:
+                return
@@ -1,16 +1,56 @@
 #!/usr/bin/env python3
 """A module for securely handling passwords using bcrypt encryption.
 """
+import os
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Tuple
 
 
-def hash_password(password: str) -> bytes:
+ROUNDS = int(os.getenv("PERSONAL_DATA_BCRYPT_ROUNDS", 12))
+
+
+def hash_password(password: str, rounds: int = ROUNDS) -> bytes:
     """Encrypts a user's password using a randomly generated salt.
     """
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """Checks if a hashed password matches the provided user password.
     """
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+def hash_passwords(
+    passwords: Iterable[str], rounds: int = ROUNDS, workers: int = None,
+        ) -> List[bytes]:
+    """Encrypts many passwords in parallel, keeping their order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            lambda password: hash_password(password, rounds), passwords))
+
+
+def verify_many(
+    pairs: Iterable[Tuple[bytes, str]], workers: int = None,
+        ) -> List[bool]:
+    """Checks many (hashed_password, password) pairs in parallel.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda pair: is_valid(*pair), pairs))
+
+
+def get_rounds(hashed_password: bytes) -> int:
+    """Extracts the work factor from a bcrypt hash.
+    """
+    return int(hashed_password.split(b'$')[2])
+
+
+def needs_rehash(hashed_password: bytes, rounds: int = ROUNDS) -> bool:
+    """Checks if a hash was made with a different work factor.
+    """
+    try:
+        return get_rounds(hashed_password) != rounds
+    except (IndexError, ValueError):
+        return True
@@ -3,9 +3,21 @@
 """
 import os
 import re
+import copy
+import sys
+import time
+import queue
+import atexit
+import threading
 import logging
+import logging.handlers
 import mysql.connector
-from typing import List
+from functools import lru_cache
+from operator import itemgetter
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+from connection_pool import ConnectionPool
+from log_sinks import make_sink
 
 
 patterns = {
@@ -13,6 +25,39 @@ patterns = {
     'replace': lambda x: r'\g<field>={}'.format(x),
 }
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
+REDACTOR_CACHE_SIZE = 128
+FETCH_SIZE = 1000
+QUEUE_SIZE = 10000
+SENTINEL_TIMEOUT = 0.1
+OVERFLOW_POLICIES = ("block", "drop", "count")
+db_pool = None
+db_pool_lock = threading.Lock()
+
+
+class Redactor:
+    """Redacts a fixed set of fields from log lines in a single scan.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], redaction: str,
+                 separator: str):
+        extract, replace = (patterns["extract"], patterns["replace"])
+        self.fields = tuple(fields)
+        self.pattern = re.compile(extract(self.fields, separator))
+        self.replacement = replace(redaction.replace('\\', r'\\'))
+
+    def redact(self, message: str) -> str:
+        """Replaces the values of all the fields in a log line.
+        """
+        return self.pattern.sub(self.replacement, message)
+
+
+@lru_cache(maxsize=REDACTOR_CACHE_SIZE)
+def get_redactor(
+    fields: Tuple[str, ...], redaction: str, separator: str,
+        ) -> Redactor:
+    """Retrieves the compiled redactor for a set of fields.
+    """
+    return Redactor(fields, redaction, separator)
 
 
 def filter_datum(
@@ -20,22 +65,124 @@ def filter_datum(
         ) -> str:
     """Filters a log line to redact sensitive information.
     """
-    extract, replace = (patterns["extract"], patterns["replace"])
-    return re.sub(extract(fields, separator), replace(redaction), message)
+    redactor = get_redactor(tuple(fields), redaction, separator)
+    return redactor.redact(message)
+
+
+class OverflowQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues log records on a bounded queue with an overflow policy.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy: {}".format(overflow))
+        super(OverflowQueueHandler, self).__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.listener = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Snapshots the message of a record on the calling thread.
+
+        Arguments are merged into string messages and dict messages are
+        copied, so later changes by the caller don't reach the log and
+        formatting errors surface at the call site. Redaction is left to
+        the listener thread.
+        """
+        record = copy.copy(record)
+        if isinstance(record.msg, dict):
+            record.msg = dict(record.msg)
+        elif record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        """Puts a record on the queue, applying the overflow policy.
+        """
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == "count":
+                self.dropped += 1
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """Processes queued log records on a background thread.
+    """
+
+    def handle(self, record: logging.LogRecord):
+        """Passes a record to the handlers, surviving their errors.
+        """
+        record = self.prepare(record)
+        for handler in self.handlers:
+            if self.respect_handler_level and record.levelno < handler.level:
+                continue
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+    def enqueue_sentinel(self):
+        """Waits for room on a full queue while the thread is running.
+        """
+        while self._thread is not None and self._thread.is_alive():
+            try:
+                self.queue.put(self._sentinel, timeout=SENTINEL_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+
+def get_sink() -> logging.Handler:
+    """Creates the output handler configured for the user data logger.
+    """
+    sink = os.getenv("PERSONAL_DATA_LOG_SINK", "stream")
+    if sink == "stream":
+        return logging.StreamHandler()
+    filename = os.getenv("PERSONAL_DATA_LOG_FILE", "user_data.log")
+    return make_sink(sink, filename)
 
 
-def get_logger() -> logging.Logger:
+def get_logger(
+    queue_size: int = QUEUE_SIZE, overflow: str = "block",
+    sink: logging.Handler = None,
+        ) -> logging.Logger:
     """Creates a new logger for handling sensitive user data.
     """
     logger = logging.getLogger("user_data")
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
     logger.setLevel(logging.INFO)
     logger.propagate = False
-    logger.addHandler(stream_handler)
+    for handler in logger.handlers:
+        if isinstance(handler, OverflowQueueHandler):
+            return logger
+    sink = sink or get_sink()
+    sink.setFormatter(RedactingFormatter(PII_FIELDS))
+    queue_handler = OverflowQueueHandler(queue.Queue(queue_size), overflow)
+    queue_handler.listener = DrainingQueueListener(
+        queue_handler.queue, sink, respect_handler_level=True)
+    queue_handler.listener.start()
+    logger.addHandler(queue_handler)
     return logger
 
 
+@atexit.register
+def close_logger():
+    """Drains the queue of the user data logger and detaches its handler.
+    """
+    logger = logging.getLogger("user_data")
+    for handler in list(logger.handlers):
+        if isinstance(handler, OverflowQueueHandler):
+            logger.removeHandler(handler)
+            handler.listener.stop()
+            for listened in handler.listener.handlers:
+                listened.close()
+            handler.close()
+
+
 def get_db() -> mysql.connector.connection.MySQLConnection:
     """Creates a connector to a database.
     """
@@ -52,26 +199,63 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return connection
 
 
-def main():
+def get_pool(connect: Callable = None) -> ConnectionPool:
+    """Retrieves the shared pool of database connections.
+    """
+    global db_pool
+    with db_pool_lock:
+        if db_pool is None:
+            db_pool = ConnectionPool(
+                connect or get_db,
+                size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", 5)),
+                timeout=float(os.getenv("PERSONAL_DATA_DB_POOL_TIMEOUT", 30)),
+                ping=os.getenv("PERSONAL_DATA_DB_POOL_PING", "1") != "0",
+            )
+        return db_pool
+
+
+def stream_rows(cursor, fetch_size: int) -> Iterator[List[tuple]]:
+    """Yields the rows of an executed query in batches.
+    """
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def main(fetch_size: int = None):
     """Logs information about user records in a table.
     """
+    if fetch_size is None:
+        fetch_size = int(os.getenv("PERSONAL_DATA_FETCH_SIZE", FETCH_SIZE))
     fields = "name,email,phone,ssn,password,ip,last_login,user_agent"
     columns = fields.split(',')
     query = "SELECT {} FROM users;".format(fields)
+    row_redactor = RowRedactor(columns)
     info_logger = get_logger()
-    connection = get_db()
-    with connection.cursor() as cursor:
+    row_count, start = 0, time.perf_counter()
+    with get_pool().connection() as connection:
+        cursor = connection.cursor()
         cursor.execute(query)
-        rows = cursor.fetchall()
-        for row in rows:
-            record = map(
-                lambda x: '{}={}'.format(x[0], x[1]),
-                zip(columns, row),
-            )
-            msg = '{};'.format('; '.join(list(record)))
-            args = ("user_data", logging.INFO, None, None, msg, None, None)
-            log_record = logging.LogRecord(*args)
-            info_logger.handle(log_record)
+        for rows in stream_rows(cursor, fetch_size):
+            for msg in row_redactor.format_rows(rows):
+                args = ("user_data", logging.INFO, None, None, msg, None, None)
+                info_logger.handle(RedactedLogRecord(*args))
+            row_count += len(rows)
+        cursor.close()
+    close_logger()
+    elapsed = time.perf_counter() - start
+    print(
+        "Logged {} rows in {:.3f}s ({:.0f} rows/s)".format(
+            row_count, elapsed, row_count / elapsed if elapsed else 0),
+        file=sys.stderr,
+    )
+
+
+class RedactedLogRecord(logging.LogRecord):
+    """A log record whose message was redacted when it was built.
+    """
 
 
 class RedactingFormatter(logging.Formatter):
@@ -86,13 +270,106 @@ class RedactingFormatter(logging.Formatter):
     def __init__(self, fields: List[str]):
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.field_set = frozenset(fields)
+        self.redactor = get_redactor(
+            tuple(fields), self.REDACTION, self.SEPARATOR)
+
+    def format_fields(self, fields: dict) -> str:
+        """Renders field/value pairs, redacting sensitive ones by key.
+        """
+        redacted, redaction = (self.field_set, self.REDACTION)
+        pairs = [
+            '{}={}'.format(k, redaction if k in redacted else v)
+            for k, v in fields.items()
+        ]
+        return '{}{}'.format(
+            '{} '.format(self.SEPARATOR).join(pairs), self.SEPARATOR)
 
     def format(self, record: logging.LogRecord) -> str:
         """Formats a LogRecord with redacted sensitive information.
+
+        A dict message is treated as field/value pairs and redacted by
+        key before formatting, and any traceback appended to it is
+        scanned for them; RedactedLogRecord instances are
+        formatted as is; any other message is formatted first and then
+        scanned for the redacted fields.
+        """
+        if isinstance(record, RedactedLogRecord):
+            return super(RedactingFormatter, self).format(record)
+        if not isinstance(record.msg, dict):
+            msg = super(RedactingFormatter, self).format(record)
+            return self.redactor.redact(msg)
+        record.message = self.format_fields(record.msg)
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        msg = self.formatMessage(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        trailer = ''
+        if record.exc_text:
+            trailer = '\n' + record.exc_text
+        if record.stack_info:
+            trailer += '\n' + self.formatStack(record.stack_info)
+        return msg + self.redactor.redact(trailer)
+
+
+def escape_braces(text: str) -> str:
+    """Escapes text for literal use in a str.format template.
+    """
+    return str(text).replace('{', '{{').replace('}', '}}')
+
+
+class RowRedactor:
+    """Redacts tabular query results by column position.
+    """
+
+    def __init__(
+        self, columns: Sequence[str], fields: Sequence[str] = PII_FIELDS,
+        redaction: str = RedactingFormatter.REDACTION,
+        separator: str = RedactingFormatter.SEPARATOR,
+            ):
+        self.columns = tuple(columns)
+        self.redaction = redaction
+        self.indexes = tuple(
+            i for i, column in enumerate(self.columns) if column in fields)
+        kept = [
+            i for i in range(len(self.columns)) if i not in self.indexes]
+        if len(kept) == 1:
+            self.kept = lambda row: (row[kept[0]],)
+        else:
+            self.kept = itemgetter(*kept) if kept else lambda row: ()
+        pairs = [
+            '{}={}'.format(
+                escape_braces(column),
+                escape_braces(redaction) if i in self.indexes else '{}')
+            for i, column in enumerate(self.columns)
+        ]
+        self.template = '{}{}'.format(
+            '{} '.format(separator).join(pairs), escape_braces(separator))
+
+    def redact_row(self, row: Sequence) -> tuple:
+        """Replaces the sensitive values of a row.
+        """
+        values = list(row)
+        for i in self.indexes:
+            values[i] = self.redaction
+        return tuple(values)
+
+    def redact_rows(self, rows: Sequence[Sequence]) -> List[tuple]:
+        """Replaces the sensitive values of a batch of rows.
+        """
+        return list(map(self.redact_row, rows))
+
+    def format_row(self, row: Sequence) -> str:
+        """Builds the redacted log line of a row.
+        """
+        return self.template.format(*self.kept(row))
+
+    def format_rows(self, rows: Sequence[Sequence]) -> List[str]:
+        """Builds the redacted log lines of a batch of rows.
         """
-        msg = super(RedactingFormatter, self).format(record)
-        txt = filter_datum(self.fields, self.REDACTION, msg, self.SEPARATOR)
-        return txt
+        template, kept = (self.template.format, self.kept)
+        return [template(*kept(row)) for row in rows]
 
 
 if __name__ == "__main__":
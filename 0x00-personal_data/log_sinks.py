@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""A module of batched output sinks for the user data logger.
+"""
+import os
+import gzip
+import time
+import logging
+import threading
+from typing import BinaryIO
+
+
+BUFFER_SIZE = 64 * 1024
+FLUSH_INTERVAL = 1.0
+
+
+class BufferedFileSink(logging.Handler):
+    """Appends formatted records to a file in batches.
+
+    Records are buffered in memory and written once the buffer reaches
+    ``buffer_size`` bytes or every ``flush_interval`` seconds. Write
+    errors go to ``handleError`` like in the standard handlers, and the
+    batch that failed is dropped.
+    """
+
+    def __init__(
+        self, filename: str, buffer_size: int = BUFFER_SIZE,
+        flush_interval: float = FLUSH_INTERVAL, encoding: str = 'utf-8',
+            ):
+        super(BufferedFileSink, self).__init__()
+        self.filename = os.path.abspath(filename)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.encoding = encoding
+        self.buffer = []
+        self.buffered = 0
+        self.stream = None
+        self.closed = threading.Event()
+        self.flusher = None
+        if flush_interval > 0:
+            self.flusher = threading.Thread(
+                target=self.flush_periodically, daemon=True)
+            self.flusher.start()
+
+    def open(self) -> BinaryIO:
+        """Opens the underlying file for appending.
+        """
+        return open(self.filename, 'ab')
+
+    def emit(self, record: logging.LogRecord):
+        """Buffers a formatted record, writing out a full buffer.
+        """
+        try:
+            data = '{}\n'.format(self.format(record)).encode(self.encoding)
+        except Exception:
+            self.handleError(record)
+            return
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.buffer_size:
+            try:
+                self.flush()
+            except Exception:
+                self.handleError(record)
+
+    def write(self, data: bytes):
+        """Writes a batch of formatted records to the file.
+        """
+        if self.stream is None:
+            self.stream = self.open()
+        self.stream.write(data)
+        self.stream.flush()
+
+    def flush(self):
+        """Writes out the buffered records.
+        """
+        self.acquire()
+        try:
+            if self.buffer:
+                data = b''.join(self.buffer)
+                self.buffer, self.buffered = [], 0
+                self.write(data)
+        finally:
+            self.release()
+
+    def flush_periodically(self):
+        """Flushes the buffer every interval until the sink is closed.
+        """
+        while not self.closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                self.handleError(None)
+
+    def close(self):
+        """Flushes the buffer and closes the file.
+        """
+        self.closed.set()
+        self.acquire()
+        try:
+            try:
+                self.flush()
+            except Exception:
+                self.handleError(None)
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+        finally:
+            self.release()
+            super(BufferedFileSink, self).close()
+
+
+class RotatingSink(BufferedFileSink):
+    """A buffered file sink rotating on file size or age.
+
+    The current file is renamed to ``<filename>.1`` (shifting older ones
+    up to ``backup_count``) once it exceeds ``max_bytes`` bytes or has
+    been open for ``max_age`` seconds; zero disables either limit.
+    """
+
+    def __init__(
+        self, filename: str, max_bytes: int = 0, max_age: float = 0,
+        backup_count: int = 5, **kwargs,
+            ):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.opened_at = time.monotonic()
+        super(RotatingSink, self).__init__(filename, **kwargs)
+
+    def open(self) -> BinaryIO:
+        """Opens the underlying file and restarts its age.
+        """
+        self.opened_at = time.monotonic()
+        return super(RotatingSink, self).open()
+
+    def should_rotate(self, size: int) -> bool:
+        """Checks if writing a batch should start a new file.
+        """
+        if self.stream is None:
+            return False
+        if self.max_age and time.monotonic() - self.opened_at >= self.max_age:
+            return True
+        if self.max_bytes and self.stream.tell() > 0:
+            return self.stream.tell() + size > self.max_bytes
+        return False
+
+    def rotate(self):
+        """Closes the current file and shifts the backups.
+        """
+        self.stream.close()
+        self.stream = None
+        for i in range(self.backup_count - 1, 0, -1):
+            src = '{}.{}'.format(self.filename, i)
+            if os.path.exists(src):
+                os.replace(src, '{}.{}'.format(self.filename, i + 1))
+        if self.backup_count > 0:
+            os.replace(self.filename, '{}.1'.format(self.filename))
+        else:
+            os.remove(self.filename)
+
+    def write(self, data: bytes):
+        """Writes a batch of formatted records, rotating first if due.
+        """
+        if self.should_rotate(len(data)):
+            self.rotate()
+        super(RotatingSink, self).write(data)
+
+
+class GzipSink(BufferedFileSink):
+    """A buffered file sink compressing its output with gzip.
+    """
+
+    def __init__(self, filename: str, compresslevel: int = 6, **kwargs):
+        self.compresslevel = compresslevel
+        super(GzipSink, self).__init__(filename, **kwargs)
+
+    def open(self) -> BinaryIO:
+        """Opens the underlying file as a new gzip member.
+        """
+        return gzip.open(self.filename, 'ab', self.compresslevel)
+
+
+SINKS = {
+    'file': BufferedFileSink,
+    'rotating': RotatingSink,
+    'gzip': GzipSink,
+}
+
+
+def make_sink(kind: str, filename: str, **kwargs) -> logging.Handler:
+    """Creates a sink by its name in SINKS.
+    """
+    if kind not in SINKS:
+        raise ValueError("Unknown sink: {}".format(kind))
+    return SINKS[kind](filename, **kwargs)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""A command-line tool for redacting sensitive information in log files.
+"""
+import os
+import sys
+import mmap
+import time
+import argparse
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_redactor
+
+
+CHUNK_SIZE = 16 * 1024 * 1024
+SUFFIX = ".redacted"
+
+
+def line_chunks(path: str, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """Splits a file into byte ranges that end on line boundaries.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b'\n', min(start + chunk_size, size) - 1)
+            end = size if end == -1 else end + 1
+            yield start, end
+            start = end
+
+
+def redact_chunk(
+    path: str, start: int, end: int,
+    fields: Tuple[str, ...], redaction: str, separator: str,
+        ) -> Tuple[bytes, int]:
+    """Redacts a range of a log file and counts the lines in it.
+
+    Values stop at the end of their line, as if each line went through
+    filter_datum on its own.
+    """
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        chunk = data[start:end]
+    redactor = get_redactor(fields, redaction, separator + '\n')
+    text = redactor.redact(chunk.decode('utf-8', 'surrogateescape'))
+    return text.encode('utf-8', 'surrogateescape'), chunk.count(b'\n')
+
+
+def redact_file(
+    executor: Executor, path: str, output: str, args: argparse.Namespace,
+        ) -> Tuple[int, int]:
+    """Redacts a log file across a pool, writing the chunks in order.
+    """
+    window = 2 * args.workers
+    pending, lines = deque(), 0
+    redaction = (args.fields, args.redaction, args.separator)
+    with open(output, 'wb') as out:
+        for start, end in line_chunks(path, args.chunk_size):
+            pending.append(
+                executor.submit(redact_chunk, path, start, end, *redaction))
+            if len(pending) >= window:
+                text, count = pending.popleft().result()
+                out.write(text)
+                lines += count
+        while pending:
+            text, count = pending.popleft().result()
+            out.write(text)
+            lines += count
+    return os.path.getsize(path), lines
+
+
+def output_path(path: str, output_dir: str = None) -> str:
+    """Computes where the redacted copy of a log file is written.
+    """
+    name = '{}{}'.format(os.path.basename(path), SUFFIX)
+    return os.path.join(output_dir or os.path.dirname(path), name)
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    """Parses the command-line arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Redacts sensitive fields in log files.")
+    parser.add_argument('files', nargs='+', help="log files to redact")
+    parser.add_argument(
+        '-f', '--fields', default=','.join(PII_FIELDS),
+        help="comma-separated fields to redact (default: %(default)s)")
+    parser.add_argument(
+        '-r', '--redaction', default=RedactingFormatter.REDACTION,
+        help="replacement for redacted values (default: %(default)s)")
+    parser.add_argument(
+        '-s', '--separator', default=RedactingFormatter.SEPARATOR,
+        help="field separator (default: %(default)s)")
+    parser.add_argument(
+        '-j', '--workers', type=int, default=os.cpu_count() or 1,
+        help="number of worker processes (default: %(default)s)")
+    parser.add_argument(
+        '-c', '--chunk-size', type=int, default=CHUNK_SIZE,
+        help="approximate chunk size in bytes (default: %(default)s)")
+    parser.add_argument(
+        '-o', '--output-dir',
+        help="directory for the redacted files (default: next to input)")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    args.fields = tuple(args.fields.split(','))
+    return args
+
+
+def main(argv: List[str] = None):
+    """Redacts log files and reports the throughput.
+    """
+    args = parse_args(argv)
+    total_bytes, total_lines = 0, 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for path in args.files:
+            size, lines = redact_file(
+                executor, path, output_path(path, args.output_dir), args)
+            total_bytes += size
+            total_lines += lines
+    elapsed = time.perf_counter() - start or 1e-9
+    print(
+        "Redacted {} files, {:.1f} MB, {} lines in {:.3f}s "
+        "({:.1f} MB/s, {:.0f} lines/s)".format(
+            len(args.files), total_bytes / 1e6, total_lines, elapsed,
+            total_bytes / 1e6 / elapsed, total_lines / elapsed),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from os import getenv
 from flask import Flask, jsonify, abort, request
 from flask_cors import CORS
 
+from api.v1.auth.path_matcher import PathMatcher
 from api.v1.views import app_views
 
 
@@ -13,6 +14,12 @@ app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
 auth = None
+excluded_paths = PathMatcher([
+    '/api/v1/status/',
+    '/api/v1/unauthorized/',
+    '/api/v1/forbidden/',
+    '/api/v1/auth_session/login/',
+])
 auth_type = getenv('AUTH_TYPE', 'auth')
 
 if auth_type == 'auth':
@@ -57,21 +64,15 @@ def forbidden(error) -> str:
 def authenticate_user():
     """ authenticate_user
     """
-    excluded_paths = [
-        '/api/v1/status/',
-        '/api/v1/unauthorized/',
-        '/api/v1/forbidden/',
-        '/api/v1/auth_session/login/',
-    ]
     if not auth.require_auth(request.path, excluded_paths):
         return
     if not auth.authorization_header(request) and \
        not auth.session_cookie(request):
         abort(401)
-    if not auth.current_user(request):
+    user = auth.request_user(request)
+    if not user:
         abort(403)
-    else:
-        request.current_user = auth.current_user(request)
+    request.current_user = user
 
 
 if __name__ == "__main__":
@@ -1,32 +1,26 @@
 #!/usr/bin/env python3
 """ Basic Auth
 """
-import re
 from os import getenv
-from typing import List, TypeVar
+from typing import List, TypeVar, Union
 
+from api.v1.auth.path_matcher import PathMatcher, get_matcher
 from models.user import User
 
 
 class Auth:
     """Auth class"""
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], PathMatcher]) -> bool:
         """ determines if authentication is required for the path
+
+        excluded_paths is a PathMatcher, or a list built into one once
         """
         if path is None or excluded_paths is None or excluded_paths == []:
             return True
-
-        for xpath in map(lambda x: x.strip(), excluded_paths):
-            if xpath.endswith('*'):
-                xpath = xpath.replace('*', '.*')
-            elif xpath.endswith('/'):
-                xpath = xpath.replace('/', '/*')
-            else:
-                xpath = xpath + '/*'
-
-            if re.match(xpath, path):
-                return False
-        return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = get_matcher(tuple(excluded_paths))
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request=None) -> str:
         """ returns the value of the header request Authorization
@@ -40,6 +34,18 @@ class Auth:
         if request:
             return User.get(id=request.user_id)
 
+    def request_user(self, request=None) -> TypeVar('User'):
+        """ current_user of a request, resolved once
+
+        The result is kept as request.current_user, which only lives as
+        long as the request, unlike flask.g when an app context is reused.
+        """
+        if request is None:
+            return self.current_user(request)
+        if not hasattr(request, 'current_user'):
+            request.current_user = self.current_user(request)
+        return request.current_user
+
     def session_cookie(self, request=None):
         """ returns the session cookie
         """
@@ -2,9 +2,14 @@
 """ Authentication and Authorization
 """
 import re
+import time
 import base64
+import hashlib
 import binascii
-from typing import Tuple, TypeVar
+import threading
+from collections import OrderedDict
+from os import getenv
+from typing import Optional, Tuple, TypeVar
 
 from .auth import Auth
 from models.user import User
@@ -13,6 +18,23 @@ from models.user import User
 class BasicAuth(Auth):
     """ Basic Auth class
     """
+    def __init__(self):
+        """ Initialize the cache of verified credentials
+
+        BASIC_AUTH_CACHE_TTL (seconds, default 60) and BASIC_AUTH_CACHE_SIZE
+        (entries, default 1024) bound it, 0 for either disables it.
+        """
+        try:
+            self.cache_ttl = float(getenv('BASIC_AUTH_CACHE_TTL', '60'))
+        except ValueError:
+            self.cache_ttl = 60.0
+        try:
+            self.cache_size = int(getenv('BASIC_AUTH_CACHE_SIZE', '1024'))
+        except ValueError:
+            self.cache_size = 1024
+        self.credentials = OrderedDict()
+        self.cache_lock = threading.Lock()
+
     def extract_base64_authorization_header(
             self,
             authorization_header: str
@@ -80,12 +102,55 @@ class BasicAuth(Auth):
 
         return None
 
+    def cached_user(self, key: bytes) -> Optional[TypeVar('User')]:
+        """ User of verified credentials if still cached and unchanged
+
+        The user is fetched again and must still have the email and the
+        password hash it had when the credentials were verified.
+        """
+        with self.cache_lock:
+            entry = self.credentials.get(key)
+            if entry is None:
+                return None
+            user_id, email, password, expiry = entry
+            if expiry <= time.monotonic():
+                del self.credentials[key]
+                return None
+            self.credentials.move_to_end(key)
+        user = User.get(user_id)
+        if user is None or user.email != email or user.password != password:
+            with self.cache_lock:
+                self.credentials.pop(key, None)
+            return None
+        return user
+
+    def cache_user(self, key: bytes, user: TypeVar('User')):
+        """ Cache the user of verified credentials
+        """
+        entry = (user.id, user.email, user.password,
+                 time.monotonic() + self.cache_ttl)
+        with self.cache_lock:
+            self.credentials[key] = entry
+            self.credentials.move_to_end(key)
+            while len(self.credentials) > self.cache_size:
+                self.credentials.popitem(last=False)
+
     def current_user(self, request=None) -> TypeVar('User'):
         """ Retrieves the User instance for a request
         """
         auth_header = self.authorization_header(request)
+        key = None
+        if type(auth_header) is str and \
+                self.cache_ttl > 0 and self.cache_size > 0:
+            key = hashlib.sha256(auth_header.encode()).digest()
+            user = self.cached_user(key)
+            if user is not None:
+                return user
         b64_auth_token = self.extract_base64_authorization_header(auth_header)
         auth_token = self.decode_base64_authorization_header(b64_auth_token)
         email, password = self.extract_user_credentials(auth_token)
 
-        return self.user_object_from_credentials(email, password)
+        user = self.user_object_from_credentials(email, password)
+        if user is not None and key is not None:
+            self.cache_user(key, user)
+        return user
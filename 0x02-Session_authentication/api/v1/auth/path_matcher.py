@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+""" Path matcher module
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, Tuple
+
+
+class PathMatcher():
+    """ Match request paths against a list of excluded paths
+
+    A path ending with '*' matches every path starting with the rest, a
+    path with '*' elsewhere matches it against any characters, and any
+    other path matches itself, with or without a trailing slash.
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        """ Build the matcher once from the excluded paths
+        """
+        self.literals = set()
+        self.prefixes = {}
+        patterns = []
+        for path in map(lambda x: x.strip(), paths):
+            if not path:
+                continue
+            star = path.find('*')
+            if star == -1:
+                self.literals.add(self.normalize(path))
+            elif star == len(path) - 1:
+                node = self.prefixes
+                for char in path[:-1]:
+                    node = node.setdefault(char, {})
+                node[None] = True
+            else:
+                patterns.append('.*'.join(map(re.escape, path.split('*'))))
+        self.pattern = None
+        if patterns:
+            self.pattern = re.compile('|'.join(patterns))
+
+    @staticmethod
+    def normalize(path: str) -> str:
+        """ Path without its trailing slashes
+        """
+        return path.rstrip('/') or '/'
+
+    def match(self, path: str) -> bool:
+        """ Whether a path is excluded
+        """
+        if self.normalize(path) in self.literals:
+            return True
+        node = self.prefixes
+        if None in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                return True
+        return self.pattern is not None and \
+            self.pattern.fullmatch(path) is not None
+
+
+@lru_cache(maxsize=32)
+def get_matcher(paths: Tuple[str, ...]) -> PathMatcher:
+    """ PathMatcher of a list of excluded paths, built once
+    """
+    return PathMatcher(paths)
@@ -4,12 +4,13 @@
 from uuid import uuid4
 from models.user import User
 from .auth import Auth
+from .session_store import get_session_store
 
 
 class SessionAuth(Auth):
     """ Session Auth class
     """
-    user_id_by_session_id = {}
+    user_id_by_session_id = get_session_store()
 
     def create_session(self, user_id: str = None) -> str:
         """ creates session id for user
@@ -45,5 +46,5 @@ class SessionAuth(Auth):
             return False
         if not self.user_id_for_session_id(session_id):
             return False
-        del self.user_id_by_session_id[session_id]
+        self.user_id_by_session_id.delete(session_id)
         return True
@@ -2,21 +2,26 @@
 """ Session DB Auth
 """
 from datetime import datetime, timedelta
+from uuid import uuid4
 from .session_exp_auth import SessionExpAuth
 from models.user_session import UserSession
 
-format_string = "%Y-%m-%dT%H:%M:%S"
-
 
 class SessionDBAuth(SessionExpAuth):
     """ Session DB Auth class
     """
+    def __init__(self):
+        """ init
+        """
+        super().__init__()
+        self.session_delta = timedelta(seconds=self.session_duration)
+
     def create_session(self, user_id=None):
-        """ creates session id for user
+        """ creates session id for user, stored in database only
         """
-        session_id = super().create_session(user_id)
-        if session_id is None:
+        if user_id is None or not isinstance(user_id, str):
             return None
+        session_id = str(uuid4())
         UserSession(user_id=user_id, session_id=session_id).save()
         return session_id
 
@@ -31,14 +36,7 @@ class SessionDBAuth(SessionExpAuth):
         user_session = user_session[0]
         if self.session_duration <= 0:
             return user_session.user_id
-        if 'created_at' not in user_session.to_json():
-            return None
-        created_at = user_session.to_json().get('created_at')
-        if created_at is None:
-            return None
-        expire_at = datetime.strptime(created_at, format_string)\
-            + timedelta(seconds=self.session_duration)
-        if expire_at < datetime.now():
+        if user_session.created_at + self.session_delta < datetime.utcnow():
             return None
         return user_session.user_id
 
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+""" Session store module
+"""
+import abc
+import heapq
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from os import getenv
+from typing import Any, Iterator
+
+
+class SessionStore(MutableMapping):
+    """ Session values by session ID, each expiring after its TTL
+
+    Every `sweep_every` operations, expired sessions are removed, so
+    sessions that are never looked up again don't stay in the store.
+    """
+
+    def __init__(self, ttl: float = 0, sweep_every: int = 64):
+        """ Initialize a SessionStore
+
+        Sessions expire after `ttl` seconds by default, never if 0.
+        """
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+        self.lock = threading.RLock()
+        self.operations = 0
+        self.expired = 0
+
+    @abc.abstractmethod
+    def set(self, session_id: str, value: Any, ttl: float = None):
+        """ Store the value of a session, expiring after ttl seconds
+        """
+
+    @abc.abstractmethod
+    def expire(self, session_id: str, ttl: float) -> bool:
+        """ Make a session expire after ttl seconds, never if 0
+
+        Return False if there is no such session.
+        """
+
+    def delete(self, session_id: str) -> bool:
+        """ Remove a session, return False if there is no such session
+        """
+        try:
+            del self[session_id]
+        except KeyError:
+            return False
+        return True
+
+    @abc.abstractmethod
+    def sweep(self) -> int:
+        """ Remove the expired sessions, return how many
+        """
+
+    def tick(self):
+        """ Count an operation and sweep every sweep_every of them
+        """
+        with self.lock:
+            self.operations += 1
+            sweep = self.operations % self.sweep_every == 0
+        if sweep:
+            self.sweep()
+
+    def __setitem__(self, session_id: str, value: Any):
+        """ Store the value of a session with the default TTL
+        """
+        self.set(session_id, value)
+
+    def __repr__(self) -> str:
+        """ Live sessions as a dictionary
+        """
+        return repr(dict(self.items()))
+
+    def metrics(self) -> dict:
+        """ Numbers of live sessions and of sessions removed on expiry
+        """
+        live = len(self)
+        with self.lock:
+            return {'live': live, 'expired': self.expired}
+
+
+class MemorySessionStore(SessionStore):
+    """ Sessions of the current process
+
+    Expiry times are monotonic and kept in a heap, from which expired
+    sessions are popped on each sweep.
+    """
+
+    def __init__(self, ttl: float = 0, sweep_every: int = 64):
+        """ Initialize an empty MemorySessionStore
+        """
+        super().__init__(ttl, sweep_every)
+        self.entries = {}
+        self.heap = []
+
+    def set(self, session_id: str, value: Any, ttl: float = None):
+        """ Store the value of a session, expiring after ttl seconds
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expiry = time.monotonic() + ttl if ttl > 0 else None
+        with self.lock:
+            self.entries[session_id] = (value, expiry)
+            if expiry is not None:
+                heapq.heappush(self.heap, (expiry, session_id))
+        self.tick()
+
+    def expire(self, session_id: str, ttl: float) -> bool:
+        """ Make a session expire after ttl seconds, never if 0
+        """
+        expiry = time.monotonic() + ttl if ttl > 0 else None
+        with self.lock:
+            if session_id not in self:
+                return False
+            self.entries[session_id] = (self.entries[session_id][0], expiry)
+            if expiry is not None:
+                heapq.heappush(self.heap, (expiry, session_id))
+        return True
+
+    def sweep(self) -> int:
+        """ Remove the expired sessions, return how many
+        """
+        now = time.monotonic()
+        count = 0
+        with self.lock:
+            heap, entries = (self.heap, self.entries)
+            while heap and heap[0][0] <= now:
+                expiry, session_id = heapq.heappop(heap)
+                entry = entries.get(session_id)
+                if entry is not None and entry[1] == expiry:
+                    del entries[session_id]
+                    count += 1
+            if len(heap) > 2 * len(entries) + self.sweep_every:
+                self.heap = [(entry[1], session_id)
+                             for session_id, entry in entries.items()
+                             if entry[1] is not None]
+                heapq.heapify(self.heap)
+            self.expired += count
+        return count
+
+    def __getitem__(self, session_id: str) -> Any:
+        """ Value of a live session
+        """
+        self.tick()
+        with self.lock:
+            value, expiry = self.entries[session_id]
+            if expiry is not None and expiry <= time.monotonic():
+                del self.entries[session_id]
+                self.expired += 1
+                raise KeyError(session_id)
+            return value
+
+    def __delitem__(self, session_id: str):
+        """ Remove a session
+        """
+        self.tick()
+        with self.lock:
+            del self.entries[session_id]
+
+    def __iter__(self) -> Iterator[str]:
+        """ IDs of the live sessions
+        """
+        self.sweep()
+        with self.lock:
+            return iter(list(self.entries))
+
+    def __len__(self) -> int:
+        """ Number of live sessions
+        """
+        self.sweep()
+        return len(self.entries)
+
+
+class SQLiteSessionStore(SessionStore):
+    """ Sessions shared by the processes using the same SQLite file
+
+    Values are strings. Expiry times are on the wall clock, which all
+    processes share, and indexed for the sweeps.
+    """
+
+    def __init__(self, db_path: str = ".sessions.sqlite3",
+                 ttl: float = 0, sweep_every: int = 64):
+        """ Initialize a SQLiteSessionStore
+        """
+        super().__init__(ttl, sweep_every)
+        self.db_path = db_path
+        self.local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS sessions '
+                    '(id TEXT PRIMARY KEY, value TEXT NOT NULL, expiry REAL)')
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS sessions_expiry '
+                    'ON sessions (expiry)')
+            self.local.conn = conn
+        return conn
+
+    def set(self, session_id: str, value: Any, ttl: float = None):
+        """ Store the value of a session, expiring after ttl seconds
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expiry = time.time() + ttl if ttl > 0 else None
+        with self.connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (id, value, expiry) '
+                'VALUES (?, ?, ?)', (session_id, value, expiry))
+        self.tick()
+
+    def expire(self, session_id: str, ttl: float) -> bool:
+        """ Make a session expire after ttl seconds, never if 0
+        """
+        expiry = time.time() + ttl if ttl > 0 else None
+        with self.connection() as conn:
+            cursor = conn.execute(
+                'UPDATE sessions SET expiry = ? '
+                'WHERE id = ? AND (expiry IS NULL OR expiry > ?)',
+                (expiry, session_id, time.time()))
+        return cursor.rowcount > 0
+
+    def sweep(self) -> int:
+        """ Remove the expired sessions, return how many
+        """
+        with self.connection() as conn:
+            count = conn.execute('DELETE FROM sessions WHERE expiry <= ?',
+                                 (time.time(),)).rowcount
+        with self.lock:
+            self.expired += count
+        return count
+
+    def __getitem__(self, session_id: str) -> Any:
+        """ Value of a live session
+        """
+        self.tick()
+        row = self.connection().execute(
+            'SELECT value, expiry FROM sessions WHERE id = ?',
+            (session_id,)).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        value, expiry = row
+        if expiry is not None and expiry <= time.time():
+            with self.connection() as conn:
+                count = conn.execute(
+                    'DELETE FROM sessions WHERE id = ? AND expiry = ?',
+                    (session_id, expiry)).rowcount
+            with self.lock:
+                self.expired += count
+            raise KeyError(session_id)
+        return value
+
+    def __delitem__(self, session_id: str):
+        """ Remove a session
+        """
+        self.tick()
+        with self.connection() as conn:
+            count = conn.execute('DELETE FROM sessions WHERE id = ?',
+                                 (session_id,)).rowcount
+        if count == 0:
+            raise KeyError(session_id)
+
+    def __iter__(self) -> Iterator[str]:
+        """ IDs of the live sessions
+        """
+        self.sweep()
+        return iter([row[0] for row in self.connection().execute(
+            'SELECT id FROM sessions ORDER BY rowid')])
+
+    def __len__(self) -> int:
+        """ Number of live sessions
+        """
+        self.sweep()
+        return self.connection().execute(
+            'SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+
+def get_session_store(ttl: float = 0) -> SessionStore:
+    """ Session store selected by SESSION_STORE
+
+    'memory' (default) keeps sessions in the process, 'sqlite' shares
+    them through the file at SESSION_STORE_PATH.
+    """
+    store = getenv('SESSION_STORE', 'memory')
+    if store == 'sqlite':
+        return SQLiteSessionStore(
+            getenv('SESSION_STORE_PATH', '.sessions.sqlite3'), ttl)
+    return MemorySessionStore(ttl)
@@ -2,8 +2,10 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request
+from models.base import PAGE_SIZE
 from models.user import User
+import json
 
 
 def get_user_or_404(user_id):
@@ -18,11 +20,37 @@ def get_user_or_404(user_id):
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional, any of them pages the list):
+      - limit: number of users per page
+      - after: cursor of the previous page (X-Next-Cursor header)
+      - offset: number of users skipped after the cursor
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, streamed
+      - one page of User objects ordered by creation when paged
+      - 400 if a query parameter is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    if not any(arg in request.args for arg in ('limit', 'after', 'offset')):
+        def generate():
+            sep = '['
+            for user in User.iterate():
+                yield sep + json.dumps(user.to_json())
+                sep = ','
+            yield '[]\n' if sep == '[' else ']\n'
+        return Response(generate(), mimetype='application/json')
+
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+        offset = int(request.args.get('offset', 0))
+        if limit < 1 or offset < 0:
+            raise ValueError("limit or offset out of range")
+        users, cursor = User.page(limit=limit, offset=offset,
+                                  after=request.args.get('after'))
+    except ValueError as e:
+        return jsonify({'error': "Invalid page: {}".format(e)}), 400
+    response = jsonify([user.to_json() for user in users])
+    if cursor is not None:
+        response.headers['X-Next-Cursor'] = cursor
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
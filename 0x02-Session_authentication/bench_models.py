@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+""" Benchmark of the memory and serialization cost of User objects
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+
+from models.user import User
+
+
+def make_users(count: int) -> list:
+    """ Build users the way they are loaded from file
+    """
+    return [
+        User(id=str(uuid.uuid4()),
+             created_at="2017-09-25T01:55:17",
+             updated_at="2017-09-25T01:55:17",
+             email="user{}@hbtn.io".format(i),
+             _password="{:064x}".format(i),
+             first_name="First{}".format(i),
+             last_name="Last{}".format(i))
+        for i in range(count)
+    ]
+
+
+def main():
+    """ Print the memory per user and the to_json throughput
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--count', type=int, default=1000000,
+                        help="number of users (default: %(default)s)")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = make_users(args.count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print("memory: {:.1f} MB per 1M users ({:.0f} B/user)".format(
+        used / args.count, used / args.count))
+
+    for for_serialization in (False, True):
+        start = time.perf_counter()
+        for user in users:
+            user.to_json(for_serialization)
+        elapsed = time.perf_counter() - start
+        print("to_json({}): {:.0f} objects/s".format(
+            for_serialization, args.count / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+""" Main 6
+"""
+from models.user import User
+
+""" Create a user test """
+user = User()
+user.email = "bobsearch@hbtn.io"
+user.password = "fake pwd"
+user.save()
+
+""" Operators match the same users as equality """
+for attr in ('created_at', 'updated_at'):
+    value = getattr(user, attr)
+    for key in (attr, attr + '__in', attr + '__gte', attr + '__lte'):
+        operand = [value] if key.endswith('__in') else value
+        found = user in User.search({key: operand})
+        print("{}: {}".format(key, found))
+    for key in (attr + '__gt', attr + '__lt'):
+        found = user in User.search({key: value})
+        print("{}: {}".format(key, found))
+
+user.remove()
@@ -1,37 +1,186 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from contextlib import contextmanager
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from itertools import islice
+from os import getenv
+from typing import TypeVar, List, Iterable, Iterator, Optional, Tuple
+import heapq
+import threading
 import uuid
 
+from models.index import HashIndex, SortedIndex, matches, split_lookup
+from models.storage import get_storage
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+ORDERED_INDEXES = {}
+STORAGE = get_storage()
+LAZY_LOAD = getenv('MODEL_LAZY_LOAD', '0') == '1'
+PAGE_SIZE = 100
+DEFERRED = threading.local()
+
+
+STORED_OPERATORS = {'gt': 'gte', 'lt': 'lte'}
+
+
+def timestamp_value(value):
+    """ Datetime of an ISO 8601 string, other values as they are
+    """
+    if type(value) is str:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def timestamp_text(value):
+    """ Stored form of a datetime, truncated to the second
+    """
+    if type(value) is datetime:
+        return value.strftime(TIMESTAMP_FORMAT)
+    return value
+
+
+class Timestamp():
+    """ Datetime attribute stored along with its string form
+
+    Each form is computed from the other on first use and both are kept
+    until the attribute is set again.
+    """
+
+    def __set_name__(self, owner: type, name: str):
+        """ Bind the slots holding both forms
+        """
+        self.name = name
+        self.value = "_{}".format(name)
+        self.text = "_{}_text".format(name)
+
+    def __get__(self, obj, objtype: type = None) -> datetime:
+        """ Parse the stored string if needed
+        """
+        if obj is None:
+            return self
+        value = getattr(obj, self.value)
+        if value is None:
+            value = datetime.strptime(getattr(obj, self.text),
+                                      TIMESTAMP_FORMAT)
+            setattr(obj, self.value, value)
+        return value
+
+    def __set__(self, obj, value):
+        """ Store a datetime or its string form
+        """
+        if type(value) is str:
+            setattr(obj, self.value, None)
+            setattr(obj, self.text, value)
+        else:
+            setattr(obj, self.value, value)
+            setattr(obj, self.text, None)
+
+    def serialize(self, obj) -> str:
+        """ String form of the datetime
+        """
+        text = getattr(obj, self.text)
+        if text is None:
+            value = getattr(obj, self.value)
+            if type(value) is not datetime:
+                return value
+            text = value.strftime(TIMESTAMP_FORMAT)
+            setattr(obj, self.text, text)
+        return text
+
+
+class LazyObjects(dict):
+    """ Objects of a class by ID, built from their JSON on first access
+    """
+
+    def __init__(self, cls: type):
+        """ Initialize an empty LazyObjects
+        """
+        super().__init__()
+        self.cls = cls
+
+    def __getitem__(self, obj_id: str):
+        """ Object by ID
+        """
+        obj = super().__getitem__(obj_id)
+        if type(obj) is dict:
+            obj = self.cls(**obj)
+            super().__setitem__(obj_id, obj)
+        return obj
+
+    def get(self, obj_id: str, default=None):
+        """ Object by ID, or default
+        """
+        if obj_id in self:
+            return self[obj_id]
+        return default
+
+    def values(self) -> list:
+        """ All objects
+        """
+        return [self[obj_id] for obj_id in self]
+
+    def items(self) -> list:
+        """ All objects by ID
+        """
+        return [(obj_id, self[obj_id]) for obj_id in self]
+
+    def copy(self) -> 'LazyObjects':
+        """ Shallow copy keeping pending objects unbuilt
+        """
+        objs = LazyObjects(self.cls)
+        dict.update(objs, self)
+        return objs
+
+    def serialize(self) -> dict:
+        """ JSON dictionaries by ID, without building pending objects
+        """
+        objs_json = {}
+        for obj_id, obj in super().items():
+            if type(obj) is not dict:
+                obj = obj.to_json(True)
+            objs_json[obj_id] = obj
+        return objs_json
 
 
 class Base():
     """ Base class
     """
 
+    __slots__ = ('id', '_created_at', '_created_at_text',
+                 '_updated_at', '_updated_at_text')
+    indexed_attributes = ()
+    ordered_attributes = ()
+    attribute_names = ()
+    created_at = Timestamp()
+    updated_at = Timestamp()
+
+    def __init_subclass__(cls, **kwargs):
+        """ Collect the attributes declared in __slots__ by subclasses
+        """
+        super().__init_subclass__(**kwargs)
+        names = []
+        for klass in reversed(cls.__mro__[:cls.__mro__.index(Base)]):
+            names.extend(klass.__dict__.get('__slots__', ()))
+        cls.attribute_names = tuple(names)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA[s_class] = LazyObjects(self.__class__)
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = kwargs.get('created_at')
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = kwargs.get('updated_at')
         else:
             self.updated_at = datetime.utcnow()
 
@@ -47,8 +196,18 @@ class Base():
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
-        result = {}
-        for key, value in self.__dict__.items():
+        result = {
+            'id': self.id,
+            'created_at': Base.created_at.serialize(self),
+            'updated_at': Base.updated_at.serialize(self),
+        }
+        for key in self.attribute_names:
+            if not for_serialization and key[0] == '_':
+                continue
+            value = getattr(self, key, result)
+            if value is not result:
+                result[key] = value
+        for key, value in getattr(self, '__dict__', {}).items():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -60,52 +219,241 @@ class Base():
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
+
+        With MODEL_LAZY_LOAD=1, objects are only built on first access.
+        """
+        cls.load_objects(STORAGE.load(cls.__name__))
+
+    @classmethod
+    def load_objects(cls, objs_json: dict):
+        """ Replace all objects by their JSON dictionaries
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        objs = LazyObjects(cls)
+        INDEXES.pop(s_class, None)
+        ORDERED_INDEXES.pop(s_class, None)
+        dict.update(objs, objs_json)
+        for attr, index in cls.all_indexes():
+            index.add_many((obj_id, obj_json.get(attr))
+                           for obj_id, obj_json in objs_json.items())
+        if not LAZY_LOAD:
+            objs.values()
+        DATA[s_class] = objs
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
+    @classmethod
+    def refresh(cls):
+        """ Reload the objects changed in file by other processes
+        """
+        s_class = cls.__name__
+        result = STORAGE.refresh(s_class)
+        if result is None:
+            return
+        reset, objs_json = result
+        if reset or DATA.get(s_class) is None:
+            cls.load_objects(objs_json)
+            return
+        objs = DATA[s_class]
+        for attr, index in cls.all_indexes():
+            index.add_many((obj_id, obj_json.get(attr))
+                           for obj_id, obj_json in objs_json.items()
+                           if obj_json is not None)
             for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+                if obj_json is None:
+                    index.discard(obj_id)
+        for obj_id, obj_json in objs_json.items():
+            if obj_json is None:
+                objs.pop(obj_id, None)
+            else:
+                dict.__setitem__(objs, obj_id, obj_json)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        STORAGE.snapshot(s_class, DATA.get(s_class))
+
+    @classmethod
+    def indexes(cls) -> dict:
+        """ Secondary indexes of the class by attribute
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            INDEXES[s_class] = {
+                attr: HashIndex() for attr in cls.indexed_attributes
+            }
+        return INDEXES[s_class]
+
+    @classmethod
+    def ordered_index(cls, attr: str) -> Optional[SortedIndex]:
+        """ Sorted index of an ordered attribute, built on first use
+
+        Loading objects drops the sorted indexes, so that only the
+        attributes queried afterwards pay for sorting.
+        """
+        if attr not in cls.ordered_attributes:
+            return None
+        s_class = cls.__name__
+        indexes = ORDERED_INDEXES.setdefault(s_class, {})
+        if indexes.get(attr) is None:
+            index = SortedIndex()
+            index.add_many(
+                (obj_id, obj.get(attr) if type(obj) is dict
+                 else obj.index_value(attr))
+                for obj_id, obj in dict.items(DATA.get(s_class) or {}))
+            indexes[attr] = index
+        return indexes[attr]
+
+    @classmethod
+    def ordered_indexes(cls) -> dict:
+        """ Sorted indexes of the class built so far, by attribute
+        """
+        return ORDERED_INDEXES.get(cls.__name__, {})
+
+    @classmethod
+    def all_indexes(cls) -> List[tuple]:
+        """ (attribute, index) pairs of all indexes of the class
+        """
+        return list(cls.indexes().items()) + \
+            list(cls.ordered_indexes().items())
+
+    @classmethod
+    def is_timestamp(cls, attr: str) -> bool:
+        """ Whether an attribute is a Timestamp
+        """
+        return isinstance(getattr(cls, attr, None), Timestamp)
+
+    def index_value(self, attr: str):
+        """ Value of an attribute as indexed and stored
+        """
+        attribute = getattr(self.__class__, attr, None)
+        if isinstance(attribute, Timestamp):
+            return attribute.serialize(self)
+        return getattr(self, attr, None)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    def index(self):
+        """ Index current object
+        """
+        for attr, index in self.__class__.all_indexes():
+            index.add(self.id, self.index_value(attr))
+
+    def unindex(self):
+        """ Remove current object from indexes
+        """
+        for attr, index in self.__class__.all_indexes():
+            index.discard(self.id)
+
+    @classmethod
+    def flush(cls):
+        """ Write all deferred changes to file
+        """
+        STORAGE.flush()
+
+    @classmethod
+    def persist(cls, changes: dict):
+        """ Persist saved objects, or None for removed ones, by ID
+
+        Inside Base.deferred(), changes are kept until the block exits.
+        """
+        pending = getattr(DEFERRED, 'changes', None)
+        if pending is not None:
+            pending.setdefault(cls, {}).update(changes)
+            return
+        s_class = cls.__name__
+        STORAGE.commit(s_class, DATA.get(s_class), changes)
+
+    @classmethod
+    @contextmanager
+    def deferred(cls):
+        """ Persist the changes made in the block at once per class
+
+        Nested blocks are persisted by the outermost one. With the SQLite
+        storage, queries in the block don't see its changes.
+        """
+        if getattr(DEFERRED, 'changes', None) is not None:
+            yield
+            return
+        DEFERRED.changes = {}
+        try:
+            yield
+        finally:
+            pending, DEFERRED.changes = (DEFERRED.changes, None)
+            for klass, changes in pending.items():
+                klass.persist(changes)
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save objects of the class, persisted at once
+        """
+        s_class = cls.__name__
+        objs = list(objs)
+        if not objs:
+            return
+        cls.refresh()
+        now = datetime.utcnow()
+        for obj in objs:
+            obj.updated_at = now
+            if STORAGE.in_memory:
+                DATA[s_class][obj.id] = obj
+                obj.index()
+        cls.persist({obj.id: obj for obj in objs})
+
+    @classmethod
+    def remove_many(cls, objs_or_ids: Iterable):
+        """ Remove objects of the class, or their IDs, persisted at once
+        """
+        s_class = cls.__name__
+        ids = [obj.id if isinstance(obj, Base) else obj
+               for obj in objs_or_ids]
+        if not STORAGE.in_memory:
+            if ids:
+                cls.persist(dict.fromkeys(ids))
+            return
+        cls.refresh()
+        objs, indexes = (DATA.get(s_class, {}), cls.all_indexes())
+        changes = {}
+        for obj_id in ids:
+            if obj_id not in objs:
+                continue
+            dict.__delitem__(objs, obj_id)
+            for attr, index in indexes:
+                index.discard(obj_id)
+            changes[obj_id] = None
+        if changes:
+            cls.persist(changes)
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
+        self.__class__.refresh()
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        if STORAGE.in_memory:
+            DATA[s_class][self.id] = self
+            self.index()
+        self.__class__.persist({self.id: self})
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
+        if not STORAGE.in_memory:
+            self.__class__.persist({self.id: None})
+            return
+        self.__class__.refresh()
         if DATA[s_class].get(self.id) is not None:
             del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+            self.unindex()
+            self.__class__.persist({self.id: None})
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
+        if not STORAGE.in_memory:
+            return STORAGE.count(cls)
+        cls.refresh()
         return len(DATA[s_class].keys())
 
     @classmethod
@@ -119,19 +467,175 @@ class Base():
         """ Return one object by ID
         """
         s_class = cls.__name__
+        if not STORAGE.in_memory:
+            return STORAGE.get(cls, id)
+        cls.refresh()
         return DATA[s_class].get(id)
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
-        """ Search all objects with matching attributes
+    def query(cls, attributes: dict) -> List[tuple]:
+        """ (attribute, operator, operand) terms of search attributes
+
+        Keys may end with __gt, __gte, __lt, __lte, __startswith or
+        __in. Timestamps are compared as datetimes, like for equality,
+        and ISO 8601 strings are parsed, except for __startswith which
+        tests their string form.
+        """
+        terms = []
+        for key, value in attributes.items():
+            attr, op = split_lookup(key)
+            timestamp = op not in (None, 'startswith') and \
+                cls.is_timestamp(attr)
+            if op == 'in':
+                if timestamp:
+                    value = map(timestamp_value, value)
+                try:
+                    value = frozenset(value)
+                except TypeError:
+                    value = tuple(value)
+            elif timestamp:
+                value = timestamp_value(value)
+            terms.append((attr, op, value))
+        return terms
+
+    @classmethod
+    def stored_terms(cls, terms: List[tuple]) -> List[tuple]:
+        """ Terms on the stored form of attributes, kept by all matches
+
+        Timestamps are stored to the second, so their operands are too,
+        and strict bounds include the second of the operand.
+        """
+        stored = []
+        for attr, op, value in terms:
+            if op != 'startswith' and cls.is_timestamp(attr):
+                if op == 'in':
+                    value = frozenset(timestamp_text(v) for v in value)
+                else:
+                    op = STORED_OPERATORS.get(op, op)
+                    value = timestamp_text(value)
+            stored.append((attr, op, value))
+        return stored
+
+    @classmethod
+    def candidates(cls, terms: List[tuple]) -> Optional[Iterable[str]]:
+        """ IDs of the objects that may match stored terms, None for all
+
+        Equality and IN on the ID or an indexed attribute only check the
+        objects indexed under those values, as of their last save; else
+        an ordered attribute narrows the search to a range.
+        """
+        indexes = cls.indexes()
+        for attr, op, value in terms:
+            if op not in (None, 'in'):
+                continue
+            values = (value,) if op is None else value
+            if attr == 'id':
+                try:
+                    return dict.fromkeys(values)
+                except TypeError:
+                    continue
+            if attr in indexes and not cls.is_timestamp(attr):
+                found = [indexes[attr].lookup(v) for v in values]
+                if None not in found:
+                    return dict.fromkeys(
+                        obj_id for ids in found for obj_id in ids)
+        for attr in cls.ordered_attributes:
+            attr_terms = [(op, value) for term_attr, op, value in terms
+                          if term_attr == attr]
+            if not attr_terms:
+                continue
+            ids = cls.ordered_index(attr).select(attr_terms)
+            if ids is not None:
+                return ids
+        return None
+
+    @classmethod
+    def iterate(cls, attributes: dict = {},
+                ordered: bool = False,
+                after: Tuple[str, str] = None) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects with matching attributes (see query)
+
+        With the SQLite storage, the comparisons are run as a query,
+        which also applies `ordered` and `after` (see page).
         """
         s_class = cls.__name__
+        terms = cls.query(attributes)
+        stored = cls.stored_terms(terms)
+        timestamps = [op not in (None, 'startswith') and cls.is_timestamp(attr)
+                      for attr, op, value in terms]
         def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
+            for (attr, op, value), timestamp in zip(terms, timestamps):
+                if op is None:
+                    if (getattr(obj, attr) != value):
+                        return False
+                elif timestamp:
+                    if not matches(op, getattr(obj, attr), value):
+                        return False
+                elif not matches(op, obj.index_value(attr), value):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        if not STORAGE.in_memory:
+            yield from filter(_search, STORAGE.iterate(
+                cls, stored, after=after, ordered=ordered))
+            return
+        cls.refresh()
+        objs = DATA[s_class]
+        ids = cls.candidates(stored)
+        for obj_id in tuple(objs if ids is None else ids):
+            obj = objs.get(obj_id)
+            if obj is not None and _search(obj):
+                yield obj
+
+    @classmethod
+    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+        """
+        return list(cls.iterate(attributes))
+
+    def cursor(self) -> str:
+        """ Position of current object in (created_at, id) order
+        """
+        return "{}_{}".format(Base.created_at.serialize(self), self.id)
+
+    @classmethod
+    def page(cls, attributes: dict = {}, limit: int = PAGE_SIZE,
+             offset: int = 0, after: str = None
+             ) -> Tuple[List[TypeVar('Base')], Optional[str]]:
+        """ One page of the objects with matching attributes
+
+        Objects are ordered by (created_at, id) and start after the
+        `after` cursor, then skip `offset` objects. Return the page and
+        the cursor of the next one, None on the last page: one more
+        object is fetched to tell whether there is a next page.
+        """
+        after_key = None
+        if after is not None:
+            after_key = tuple(after.split('_', 1))
+            if len(after_key) != 2:
+                raise ValueError("Invalid cursor: {}".format(after))
+        index = None
+        if STORAGE.in_memory and not attributes:
+            cls.refresh()
+            index = cls.ordered_index('created_at')
+        if index is not None and not index.others:
+            objs = DATA[cls.__name__]
+            ids = index.after(*(after_key or (None, None)),
+                              count=offset + limit + 1)[offset:]
+            objs = [objs[obj_id] for obj_id in ids if obj_id in objs]
+        elif STORAGE.in_memory:
+            def _key(obj):
+                return (Base.created_at.serialize(obj), obj.id)
+            objs = cls.iterate(attributes)
+            if after_key is not None:
+                objs = (obj for obj in objs if _key(obj) > after_key)
+            objs = heapq.nsmallest(offset + limit + 1, objs,
+                                   key=_key)[offset:]
+        else:
+            objs = list(islice(
+                cls.iterate(attributes, ordered=True, after=after_key),
+                offset, offset + limit + 1))
+        if len(objs) <= limit:
+            return objs, None
+        objs = objs[:limit]
+        return objs, objs[-1].cursor()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+""" Index module
+"""
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable, List, Optional, Tuple
+import operator
+
+
+BULK_THRESHOLD = 64
+OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'startswith': lambda value, prefix: (
+        type(value) is str and value.startswith(prefix)),
+    'in': lambda value, values: value in values,
+}
+
+
+def split_lookup(key: str) -> Tuple[str, Optional[str]]:
+    """ Attribute and operator of a search key like 'created_at__gte'
+
+    The operator is None for plain keys, which test equality.
+    """
+    attr, sep, op = key.rpartition('__')
+    if sep and attr and op in OPERATORS:
+        return attr, op
+    return key, None
+
+
+def matches(op: str, value: Any, operand: Any) -> bool:
+    """ Whether a value passes an operator, False if they can't compare
+    """
+    try:
+        return bool(OPERATORS[op](value, operand))
+    except TypeError:
+        return False
+
+
+def prefix_end(prefix: str) -> Optional[str]:
+    """ Smallest string greater than all strings starting with prefix
+
+    None if there is no such string.
+    """
+    prefix = prefix.rstrip(chr(0x10ffff))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class HashIndex():
+    """ Map the values of one attribute to the IDs of the objects
+    """
+
+    def __init__(self):
+        """ Initialize an empty HashIndex
+        """
+        self.ids = {}
+        self.values = {}
+
+    def add(self, obj_id: str, value: Any):
+        """ Index the attribute value of an object
+        """
+        if obj_id in self.values:
+            if self.values[obj_id] == value:
+                return
+            self.discard(obj_id)
+        try:
+            self.ids.setdefault(value, {})[obj_id] = None
+        except TypeError:
+            return
+        self.values[obj_id] = value
+
+    def add_many(self, items: Iterable[Tuple[str, Any]]):
+        """ Index the attribute values of many objects
+        """
+        for obj_id, value in items:
+            self.add(obj_id, value)
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        ids = self.ids[value]
+        del ids[obj_id]
+        if not ids:
+            del self.ids[value]
+
+    def lookup(self, value: Any) -> Optional[Iterable[str]]:
+        """ IDs of the objects with a value, None if it can't be indexed
+        """
+        try:
+            return self.ids.get(value, ())
+        except TypeError:
+            return None
+
+
+class SortedIndex():
+    """ Keep the IDs of the objects ordered by the value of one attribute
+
+    Objects are ordered by (value, ID). Only string values are ordered:
+    objects with other values are kept aside and every selection returns
+    them for the caller to check.
+    """
+
+    def __init__(self):
+        """ Initialize an empty SortedIndex
+        """
+        self.keys = []
+        self.ids = []
+        self.values = {}
+        self.others = {}
+
+    def position(self, value: str, obj_id: str) -> int:
+        """ Position of (value, ID) in the index
+        """
+        low = bisect_left(self.keys, value)
+        high = bisect_right(self.keys, value, low)
+        return bisect_left(self.ids, obj_id, low, high)
+
+    def add(self, obj_id: str, value: Any):
+        """ Index the attribute value of an object
+        """
+        if obj_id in self.values:
+            if self.values[obj_id] == value:
+                return
+            self.discard(obj_id)
+        elif obj_id in self.others:
+            if type(value) is not str:
+                return
+            self.discard(obj_id)
+        if type(value) is not str:
+            self.others[obj_id] = None
+            return
+        i = self.position(value, obj_id)
+        self.keys.insert(i, value)
+        self.ids.insert(i, obj_id)
+        self.values[obj_id] = value
+
+    def add_many(self, items: Iterable[Tuple[str, Any]]):
+        """ Index the attribute values of many objects
+
+        A few objects are inserted one by one. More are merged with the
+        indexed ones and sorted once, instead of one insertion each.
+        """
+        items = dict(items)
+        if len(items) <= BULK_THRESHOLD:
+            for obj_id, value in items.items():
+                self.add(obj_id, value)
+            return
+        values = {obj_id: value for obj_id, value in self.values.items()
+                  if obj_id not in items}
+        others = {obj_id: None for obj_id in self.others
+                  if obj_id not in items}
+        for obj_id, value in items.items():
+            if type(value) is str:
+                values[obj_id] = value
+            else:
+                others[obj_id] = None
+        pairs = sorted(zip(values.values(), values.keys()))
+        self.keys = [value for value, obj_id in pairs]
+        self.ids = [obj_id for value, obj_id in pairs]
+        self.values, self.others = (values, others)
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        if obj_id in self.others:
+            del self.others[obj_id]
+            return
+        if obj_id not in self.values:
+            return
+        i = self.position(self.values.pop(obj_id), obj_id)
+        del self.keys[i]
+        del self.ids[i]
+
+    def after(self, value: str = None, obj_id: str = None,
+              count: int = None) -> List[str]:
+        """ IDs of the first objects after (value, ID), in order
+        """
+        start = 0
+        if value is not None:
+            low = bisect_left(self.keys, value)
+            high = bisect_right(self.keys, value, low)
+            start = bisect_right(self.ids, obj_id, low, high)
+        stop = None if count is None else start + count
+        return self.ids[start:stop]
+
+    def select(self, terms: Iterable[Tuple[Optional[str], Any]]
+               ) -> Optional[List[str]]:
+        """ IDs of the objects that may pass all (operator, operand) terms
+
+        None if no term can use the index.
+        """
+        low, low_op, high, high_op = (None, None, None, None)
+        runs = None
+        for op, operand in terms:
+            if op is None or op == 'in':
+                operands = (operand,) if op is None else operand
+                try:
+                    operands = sorted(set(operands))
+                except TypeError:
+                    continue
+                if not all(type(o) is str for o in operands):
+                    continue
+                runs = operands if runs is None else sorted(
+                    set(runs).intersection(operands))
+                continue
+            if type(operand) is not str:
+                continue
+            if op == 'startswith':
+                terms_low = [('gte', operand)]
+                end = prefix_end(operand)
+                terms_high = [] if end is None else [('lt', end)]
+            else:
+                terms_low = [(op, operand)] if op[0] == 'g' else []
+                terms_high = [(op, operand)] if op[0] == 'l' else []
+            for bound_op, bound in terms_low:
+                if low is None or bound > low or \
+                        (bound == low and bound_op == 'gt'):
+                    low, low_op = bound, bound_op
+            for bound_op, bound in terms_high:
+                if high is None or bound < high or \
+                        (bound == high and bound_op == 'lt'):
+                    high, high_op = bound, bound_op
+        if runs is None and low is None and high is None:
+            return None
+        start, stop = 0, len(self.keys)
+        if low is not None:
+            bisect = bisect_left if low_op == 'gte' else bisect_right
+            start = bisect(self.keys, low)
+        if high is not None:
+            bisect = bisect_right if high_op == 'lte' else bisect_left
+            stop = max(start, bisect(self.keys, high))
+        if runs is None:
+            ids = self.ids[start:stop]
+        else:
+            ids = []
+            for value in runs:
+                first = bisect_left(self.keys, value, start, stop)
+                last = bisect_right(self.keys, value, first, stop)
+                ids.extend(self.ids[first:last])
+        ids.extend(self.others)
+        return ids
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple, TypeVar
+import json
+import sqlite3
+import threading
+
+from models.index import prefix_end
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+SQL_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+SCALARS = (str, int, float, bool)
+
+
+class SQLiteStorage():
+    """ Persist each class as one table of a SQLite database
+
+    Objects are not kept in memory: get, search and count run as queries.
+    Each table has the ID, the timestamps and the indexed and ordered
+    attributes of the class as indexed columns, and the whole object as JSON.
+    """
+
+    in_memory = False
+
+    def __init__(self, db_path: str = ".db.sqlite3"):
+        """ Initialize a SQLiteStorage
+        """
+        self.db_path = db_path
+        self.local = threading.local()
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def columns(self, cls: type) -> Tuple[str, ...]:
+        """ Create the table of a class if needed and return its columns
+        """
+        s_class = cls.__name__
+        columns = self.tables.get(s_class)
+        if columns is not None:
+            return columns
+        columns = ('id', 'created_at', 'updated_at')
+        for attr in cls.indexed_attributes + cls.ordered_attributes:
+            if attr not in columns:
+                columns += (attr,)
+        with self.lock, self.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS "{}" '
+                '(id TEXT PRIMARY KEY, data TEXT NOT NULL)'.format(s_class))
+            existing = [
+                row[1] for row in
+                conn.execute('PRAGMA table_info("{}")'.format(s_class))
+            ]
+            for column in columns[1:]:
+                if column not in existing:
+                    conn.execute('ALTER TABLE "{0}" ADD COLUMN "{1}"'.format(
+                        s_class, column))
+                    conn.execute(
+                        'UPDATE "{0}" SET "{1}" = json_extract(data, ?)'
+                        .format(s_class, column), (self.json_path(column),))
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ("{1}")'
+                    .format(s_class, column))
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS "{0}_created_at_id" '
+                'ON "{0}" (created_at, id)'.format(s_class))
+        self.tables[s_class] = columns
+        return columns
+
+    @staticmethod
+    def json_path(attr: str) -> str:
+        """ JSON path of an attribute in the data column
+        """
+        return '$."{}"'.format(attr.replace('"', '\\"'))
+
+    @staticmethod
+    def sql_value(value):
+        """ Value bound in a query for an attribute value
+        """
+        if type(value) is datetime:
+            return value.strftime(TIMESTAMP_FORMAT)
+        return value
+
+    def where(self, cls: type,
+              terms: List[tuple]) -> Tuple[List[str], list]:
+        """ WHERE conditions and parameters matching search terms
+
+        Terms are (attribute, operator, operand) as built by Base.query.
+        Terms that SQLite cannot compare are left to the caller.
+        """
+        columns = self.columns(cls)
+        clauses, params = [], []
+        for attr, op, value in terms:
+            if op == 'in':
+                value = [self.sql_value(v) for v in value]
+                if not all(type(v) in SCALARS for v in value):
+                    continue
+            else:
+                value = self.sql_value(value)
+                if value is None and op is not None:
+                    continue
+                if value is not None and type(value) not in SCALARS:
+                    continue
+                if op == 'startswith' and type(value) is not str:
+                    continue
+            if attr in columns:
+                expr, expr_params = ('"{}"'.format(attr), [])
+            else:
+                expr, expr_params = ('json_extract(data, ?)',
+                                     [self.json_path(attr)])
+            if op is None and value is None:
+                conditions = [('{} IS NULL', [])]
+            elif op is None:
+                conditions = [('{} = ?', [value])]
+            elif op == 'in':
+                conditions = [('{{}} IN ({})'.format(
+                    ', '.join('?' for _ in value)), value)]
+                if not value:
+                    conditions = [('0', [])]
+                    expr_params = []
+            elif op == 'startswith':
+                conditions = [('{} >= ?', [value])]
+                end = prefix_end(value)
+                if end is not None:
+                    conditions.append(('{} < ?', [end]))
+            else:
+                conditions = [('{{}} {} ?'.format(SQL_OPERATORS[op]),
+                               [value])]
+            for condition, values in conditions:
+                clauses.append(condition.format(expr))
+                params.extend(expr_params + values)
+        return clauses, params
+
+    def rows(self, cls: type, query: str,
+             params: list) -> Iterator[TypeVar('Base')]:
+        """ Objects built from the data column of a query
+        """
+        for (data,) in self.connection().execute(query, params):
+            yield cls(**json.loads(data))
+
+    def load(self, s_class: str) -> dict:
+        """ Nothing is loaded in memory
+        """
+        return {}
+
+    def refresh(self, s_class: str) -> Optional[Tuple[bool, dict]]:
+        """ Nothing is kept in memory, so nothing goes stale
+        """
+        return None
+
+    def snapshot(self, s_class: str, objs: dict):
+        """ Every change is already written
+        """
+
+    def flush(self, s_class: str = None):
+        """ Write deferred changes, none are deferred here
+        """
+
+    def commit(self, s_class: str, objs: dict, changes: dict):
+        """ Persist changed objects (None for removed ones) of a class
+        """
+        statements = []
+        for obj_id, obj in changes.items():
+            if obj is None:
+                statements.append((
+                    'DELETE FROM "{}" WHERE id = ?'.format(s_class),
+                    (obj_id,)))
+                continue
+            columns = self.columns(obj.__class__)
+            obj_json = obj.to_json(True)
+            statements.append((
+                'INSERT INTO "{0}" ({1}, data) VALUES ({2}, ?) '
+                'ON CONFLICT(id) DO UPDATE SET {3}, data = excluded.data'
+                .format(
+                    s_class,
+                    ', '.join('"{}"'.format(c) for c in columns),
+                    ', '.join('?' for _ in columns),
+                    ', '.join('"{0}" = excluded."{0}"'.format(c)
+                              for c in columns[1:])),
+                [obj_json.get(c) for c in columns] + [json.dumps(obj_json)]))
+        with self.connection() as conn:
+            for statement, params in statements:
+                conn.execute(statement, params)
+
+    def get(self, cls: type, obj_id: str) -> Optional[TypeVar('Base')]:
+        """ Object of a class by ID
+        """
+        self.columns(cls)
+        query = 'SELECT data FROM "{}" WHERE id = ?'.format(cls.__name__)
+        return next(self.rows(cls, query, [obj_id]), None)
+
+    def iterate(self, cls: type, terms: List[tuple],
+                after: Tuple[str, str] = None,
+                ordered: bool = False) -> Iterator[TypeVar('Base')]:
+        """ Objects of a class matching the terms SQLite can compare
+
+        Ordered by (created_at, id), after that key if given, when ordered
+        is set, else in insertion order.
+        """
+        clauses, params = self.where(cls, terms)
+        if after is not None:
+            clauses.append('(created_at, id) > (?, ?)')
+            params.extend(after)
+        query = 'SELECT data FROM "{}"'.format(cls.__name__)
+        if clauses:
+            query += ' WHERE {}'.format(' AND '.join(clauses))
+        if ordered or after is not None:
+            query += ' ORDER BY created_at, id'
+        else:
+            query += ' ORDER BY rowid'
+        return self.rows(cls, query, params)
+
+    def count(self, cls: type) -> int:
+        """ Number of objects of a class
+        """
+        self.columns(cls)
+        query = 'SELECT COUNT(*) FROM "{}"'.format(cls.__name__)
+        return self.connection().execute(query).fetchone()[0]
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+""" Storage module
+"""
+from contextlib import contextmanager
+from os import getenv, path
+from typing import Dict, Optional, Tuple
+import atexit
+import json
+import logging
+import mmap
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    from orjson import dumps as fast_dumps, loads as fast_loads
+except ImportError:
+    fast_dumps = fast_loads = None
+
+
+def read_json(file_path: str) -> dict:
+    """ Read a JSON file through a memory map, with orjson if installed
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return json.loads('')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if fast_loads is None:
+                return json.loads(data[:])
+            with memoryview(data) as view:
+                return fast_loads(view)
+
+
+def write_json(file_path: str, data: dict):
+    """ Write a JSON file atomically through a temporary file
+    """
+    tmp_path = "{}.tmp".format(file_path)
+    if fast_dumps is None:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+    else:
+        with open(tmp_path, 'wb') as f:
+            f.write(fast_dumps(data))
+    os.replace(tmp_path, file_path)
+
+
+def signature(file_path: str) -> Optional[tuple]:
+    """ Identity of the current version of a file, None if missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def fingerprint(obj_json: dict) -> Optional[int]:
+    """ Hash of the values of a JSON object, None if they can't be hashed
+
+    Objects are always serialized with their keys in the same order.
+    """
+    try:
+        return hash(tuple(obj_json.values()))
+    except TypeError:
+        return None
+
+
+def fingerprints(objs_json: dict) -> Dict[str, Optional[int]]:
+    """ Fingerprints of JSON objects by ID
+    """
+    try:
+        return {obj_id: hash(tuple(obj_json.values()))
+                for obj_id, obj_json in objs_json.items()}
+    except TypeError:
+        return {obj_id: fingerprint(obj_json)
+                for obj_id, obj_json in objs_json.items()}
+
+
+def serialize_changes(objs_json: dict, changes: dict):
+    """ Apply changed objects (None for removed ones) to JSON objects
+    """
+    for obj_id, obj in changes.items():
+        if obj is None:
+            objs_json.pop(obj_id, None)
+        else:
+            objs_json[obj_id] = obj.to_json(True)
+
+
+class FileStorage():
+    """ Persist each class as one JSON file rewritten on every change
+
+    Writers hold an advisory lock on `.db_<Class>.lock`. A writer whose
+    objects are behind the file merges its changes into the file. Once
+    another process replaced the file, readers parse it again and only
+    pass on the objects whose fingerprint changed.
+    """
+
+    in_memory = True
+
+    def __init__(self):
+        """ Initialize a FileStorage
+        """
+        self.signatures = {}
+        self.versions = {}
+
+    def file_path(self, s_class: str) -> str:
+        """ Path of the JSON file of a class
+        """
+        return ".db_{}.json".format(s_class)
+
+    @contextmanager
+    def locked(self, s_class: str):
+        """ Hold the lock on the files of a class
+        """
+        with open(".db_{}.lock".format(s_class), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self, s_class: str) -> Dict[str, dict]:
+        """ Read the serialized objects of a class
+        """
+        file_path = self.file_path(s_class)
+        if not path.exists(file_path):
+            return {}
+        return read_json(file_path)
+
+    def load(self, s_class: str) -> Dict[str, dict]:
+        """ Read the serialized objects of a class to be kept in memory
+        """
+        file_path = self.file_path(s_class)
+        sig = signature(file_path)
+        objs_json = self.read(s_class)
+        self.signatures[s_class] = sig
+        self.versions[s_class] = fingerprints(objs_json)
+        return objs_json
+
+    def changed(self, s_class: str) -> bool:
+        """ Whether the objects in memory may be behind the file
+        """
+        if s_class not in self.signatures:
+            return True
+        return signature(self.file_path(s_class)) != self.signatures[s_class]
+
+    def refresh(self, s_class: str) -> Optional[Tuple[bool, dict]]:
+        """ Objects changed by other processes since the last read
+
+        Return None when nothing changed, else (True, all objects) or
+        (False, changed objects with None for removed ones).
+        """
+        if not self.changed(s_class):
+            return None
+        versions = self.versions.get(s_class)
+        objs_json = self.load(s_class)
+        if versions is None:
+            return True, objs_json
+        new_versions = self.versions[s_class]
+        changes = {
+            obj_id: obj_json for obj_id, obj_json in objs_json.items()
+            if new_versions[obj_id] is None or
+            versions.get(obj_id) != new_versions[obj_id]
+        }
+        for obj_id in versions.keys() - new_versions.keys():
+            changes[obj_id] = None
+        return False, changes
+
+    def track(self, s_class: str, changes: dict):
+        """ Record the fingerprints of objects written by this process
+        """
+        versions = self.versions.get(s_class)
+        if versions is None:
+            return
+        for obj_id, obj in changes.items():
+            if obj is None:
+                versions.pop(obj_id, None)
+            else:
+                versions[obj_id] = fingerprint(obj.to_json(True))
+
+    def snapshot(self, s_class: str, objs: dict):
+        """ Write all objects of a class
+        """
+        file_path = self.file_path(s_class)
+        with self.locked(s_class):
+            objs_json = objs.serialize()
+            write_json(file_path, objs_json)
+            self.signatures[s_class] = signature(file_path)
+            self.versions[s_class] = fingerprints(objs_json)
+
+    def commit(self, s_class: str, objs: dict, changes: dict):
+        """ Persist changed objects (None for removed ones) of a class
+        """
+        file_path = self.file_path(s_class)
+        with self.locked(s_class):
+            if self.changed(s_class):
+                objs_json = self.read(s_class)
+                serialize_changes(objs_json, changes)
+                write_json(file_path, objs_json)
+                self.signatures.pop(s_class, None)
+            else:
+                write_json(file_path, objs.serialize())
+                self.signatures[s_class] = signature(file_path)
+            self.track(s_class, changes)
+
+    def flush(self, s_class: str = None):
+        """ Write deferred changes, none are deferred here
+        """
+
+
+class JournalStorage(FileStorage):
+    """ Persist each change as one line appended to a journal
+
+    The journal is replayed over the JSON file on load and folded into it
+    after `compact_every` changes. Lines appended by other processes are
+    replayed incrementally on refresh.
+    """
+
+    def __init__(self, compact_every: int = 1000):
+        """ Initialize a JournalStorage
+        """
+        super().__init__()
+        self.compact_every = compact_every
+        self.journals = {}
+        self.offsets = {}
+        self.pending = {}
+
+    def journal_path(self, s_class: str) -> str:
+        """ Path of the journal of a class
+        """
+        return ".db_{}.journal".format(s_class)
+
+    def replay(self, s_class: str, objs_json: dict, offset: int) -> int:
+        """ Apply the complete journal lines after an offset
+
+        Return the offset after the last complete line.
+        """
+        journal_path = self.journal_path(s_class)
+        if not path.exists(journal_path):
+            return 0
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                objs_json[entry['id']] = entry['obj']
+                offset += len(line)
+        return offset
+
+    def read(self, s_class: str) -> Dict[str, dict]:
+        """ Read the serialized objects of a class and replay its journal
+        """
+        objs_json = super().read(s_class)
+        changes = {}
+        self.replay(s_class, changes, 0)
+        for obj_id, obj_json in changes.items():
+            if obj_json is None:
+                objs_json.pop(obj_id, None)
+            else:
+                objs_json[obj_id] = obj_json
+        return objs_json
+
+    def load(self, s_class: str) -> Dict[str, dict]:
+        """ Read the serialized objects of a class to be kept in memory
+
+        A torn last line left by an interrupted write is cut off.
+        """
+        with self.locked(s_class):
+            objs_json = super(JournalStorage, self).read(s_class)
+            changes = {}
+            offset = self.replay(s_class, changes, 0)
+            journal_path = self.journal_path(s_class)
+            if path.exists(journal_path) and \
+                    path.getsize(journal_path) > offset:
+                os.truncate(journal_path, offset)
+            for obj_id, obj_json in changes.items():
+                if obj_json is None:
+                    objs_json.pop(obj_id, None)
+                else:
+                    objs_json[obj_id] = obj_json
+            self.signatures[s_class] = signature(self.file_path(s_class))
+            self.offsets[s_class] = offset
+            self.pending[s_class] = len(changes)
+        return objs_json
+
+    def journal_size(self, s_class: str) -> int:
+        """ Size of the journal of a class
+        """
+        sig = signature(self.journal_path(s_class))
+        return 0 if sig is None else sig[2]
+
+    def changed(self, s_class: str) -> bool:
+        """ Whether the objects in memory may be behind the files
+        """
+        return super().changed(s_class) or \
+            self.journal_size(s_class) != self.offsets.get(s_class)
+
+    def refresh(self, s_class: str) -> Optional[Tuple[bool, dict]]:
+        """ Objects changed by other processes since the last read
+
+        Return None when nothing changed, else (True, all objects) or
+        (False, changed objects with None for removed ones).
+        """
+        offset = self.offsets.get(s_class)
+        if super().changed(s_class) or offset is None or \
+                self.journal_size(s_class) < offset:
+            return True, self.load(s_class)
+        if self.journal_size(s_class) == offset:
+            return None
+        changes = {}
+        self.offsets[s_class] = self.replay(s_class, changes, offset)
+        return False, changes
+
+    def compact(self, s_class: str, objs_json: dict):
+        """ Write the objects of a class and truncate its journal
+        """
+        file_path = self.file_path(s_class)
+        write_json(file_path, objs_json)
+        journal = self.journals.pop(s_class, None)
+        if journal is not None:
+            journal.close()
+        open(self.journal_path(s_class), 'w').close()
+        self.pending[s_class] = 0
+
+    def snapshot(self, s_class: str, objs: dict):
+        """ Write all objects of a class and truncate its journal
+        """
+        with self.locked(s_class):
+            self.compact(s_class, objs.serialize())
+            self.signatures[s_class] = signature(self.file_path(s_class))
+            self.offsets[s_class] = 0
+
+    def commit(self, s_class: str, objs: dict, changes: dict):
+        """ Append changed objects (None for removed ones) to the journal
+        """
+        lines = []
+        for obj_id, obj in changes.items():
+            entry = {
+                'id': obj_id,
+                'obj': None if obj is None else obj.to_json(True),
+            }
+            lines.append("{}\n".format(json.dumps(entry)))
+        data = "".join(lines).encode()
+        with self.locked(s_class):
+            journal = self.journals.get(s_class)
+            if journal is None:
+                journal = open(self.journal_path(s_class), 'ab')
+                self.journals[s_class] = journal
+            up_to_date = not self.changed(s_class)
+            journal.write(data)
+            journal.flush()
+            if up_to_date:
+                self.offsets[s_class] += len(data)
+            self.pending[s_class] = self.pending.get(s_class, 0) + len(lines)
+            if self.pending[s_class] < self.compact_every:
+                return
+            self.compact(s_class, self.read(s_class))
+            if up_to_date:
+                self.signatures[s_class] = signature(self.file_path(s_class))
+                self.offsets[s_class] = 0
+            else:
+                self.signatures.pop(s_class, None)
+
+
+class WriteBehindStorage():
+    """ Defer the changes persisted by another storage
+
+    Changes are grouped by class and committed by a background thread
+    every `interval` seconds, or as soon as `max_pending` are waiting.
+    """
+
+    in_memory = True
+
+    def __init__(self, storage: FileStorage, interval: float = 0.1,
+                 max_pending: int = 100):
+        """ Initialize a WriteBehindStorage and start its flusher
+        """
+        self.storage = storage
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}
+        self.count = 0
+        self.failures = 0
+        self.pending_lock = threading.Lock()
+        self.flush_lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.flusher = threading.Thread(target=self.run, daemon=True)
+        self.flusher.start()
+        atexit.register(self.flush)
+
+    def load(self, s_class: str) -> Dict[str, dict]:
+        """ Write deferred changes, then read the objects of a class
+        """
+        with self.flush_lock:
+            self.flush(s_class)
+            return self.storage.load(s_class)
+
+    def refresh(self, s_class: str) -> Optional[Tuple[bool, dict]]:
+        """ Objects changed by other processes since the last read
+
+        Deferred changes of the class are written first if its files
+        changed, so that reloading does not drop them.
+        """
+        if s_class in self.pending and self.storage.changed(s_class):
+            self.flush(s_class)
+        return self.storage.refresh(s_class)
+
+    def changed(self, s_class: str) -> bool:
+        """ Whether the objects in memory may be behind the files
+        """
+        return self.storage.changed(s_class)
+
+    def snapshot(self, s_class: str, objs: dict):
+        """ Write all objects of a class, including deferred changes
+        """
+        with self.flush_lock:
+            with self.pending_lock:
+                self.pending.pop(s_class, None)
+            self.storage.snapshot(s_class, objs)
+
+    def commit(self, s_class: str, objs: dict, changes: dict):
+        """ Queue changed objects (None for removed ones) of a class
+        """
+        with self.pending_lock:
+            entry = self.pending.setdefault(s_class, [objs, {}])
+            entry[0] = objs
+            entry[1].update(changes)
+            self.count += len(changes)
+            if self.count >= self.max_pending:
+                self.wakeup.set()
+
+    def flush(self, s_class: str = None):
+        """ Write the deferred changes of a class, or of all classes
+        """
+        with self.flush_lock:
+            with self.pending_lock:
+                if s_class is None:
+                    batch, self.pending = self.pending, {}
+                    self.count = 0
+                elif s_class in self.pending:
+                    batch = {s_class: self.pending.pop(s_class)}
+                    self.count -= len(batch[s_class][1])
+                else:
+                    batch = {}
+            error = None
+            for name, (objs, changes) in batch.items():
+                try:
+                    self.storage.commit(name, objs.copy(), changes)
+                except Exception as e:
+                    error = error or e
+                    with self.pending_lock:
+                        entry = self.pending.setdefault(name, [objs, {}])
+                        self.count -= len(entry[1])
+                        changes.update(entry[1])
+                        entry[1] = changes
+                        self.count += len(changes)
+            if error is not None:
+                raise error
+
+    def run(self):
+        """ Flush periodically, or early when woken up
+
+        Failed changes stay queued for the next flush; each failure is
+        logged and counted in `failures`.
+        """
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.failures += 1
+                logging.getLogger(__name__).exception(
+                    "Deferred model changes not written (%d pending)",
+                    self.count)
+
+
+def get_storage():
+    """ Create the storage selected by MODEL_STORAGE (file, journal or
+    sqlite)
+
+    A positive MODEL_FLUSH_INTERVAL (seconds) defers its writes, bounding
+    the changes lost on a crash to that window.
+    """
+    storage_type = getenv('MODEL_STORAGE', 'file')
+    if storage_type == 'sqlite':
+        from models.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(getenv('MODEL_SQLITE_PATH', '.db.sqlite3'))
+    if storage_type == 'journal':
+        storage = JournalStorage(int(getenv('MODEL_JOURNAL_COMPACT', 1000)))
+    else:
+        storage = FileStorage()
+    interval = float(getenv('MODEL_FLUSH_INTERVAL', 0))
+    if interval > 0:
+        max_pending = int(getenv('MODEL_FLUSH_MUTATIONS', 100))
+        storage = WriteBehindStorage(storage, interval, max_pending)
+    return storage
@@ -9,6 +9,9 @@ class UserSession(Base):
     """ UserSession class
     """
 
+    __slots__ = ('user_id', 'session_id')
+    indexed_attributes = ('session_id',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a UserSession instance
         """